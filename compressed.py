@@ -0,0 +1,236 @@
+# Transparent access to gzip / bz2 / zip packaged products
+#   sources are recognised by magic bytes, not by file extension
+#   zip members are addressed as 'VOLUME.zip/DATA/PRODUCT.IMG'
+#   gzip streams keep a shared seek point index ( zran style checkpoints )
+
+
+import io
+import os
+import bz2
+import zlib
+import bisect
+import zipfile
+import threading
+
+
+MAGIC = {
+  b'\x1f\x8b':         'gzip',
+  b'BZh':              'bz2',
+  b'PK\x03\x04':       'zip',
+}
+
+CHECKPOINT_SPACING   = 1 << 20  # least uncompressed bytes between gzip checkpoints
+CHECKPOINTS_PER_FILE = 256      # snapshots per index, each holds ~40 KiB of zlib state and window
+SNAPSHOT_BUDGET      = 1024     # snapshots kept per process across all cached indexes
+INDEX_CACHE_SIZE     = 16       # gzip indexes kept per process, small files hold no snapshots
+CHUNK_SIZE           = 1 << 16  # compressed bytes read from disk per step
+
+
+def split_member( path:str ):
+  # 'VOLUME.zip/DATA/X.IMG' -> ( 'VOLUME.zip', 'DATA/X.IMG' ), plain paths -> ( path, None )
+  i = path.lower().find( '.zip/' )
+  if i < 0 or os.path.exists( path ): return path, None
+  return path[:i+4], path[i+5:]
+
+
+def split_ext( path:str ):
+  # 'X.IMG.gz' -> ( 'X.IMG', '.gz' ), the extension is empty for plain and zip member paths
+  base, ext = os.path.splitext( path )
+  if ext.lower() in ( '.gz', '.bz2' ): return base, ext
+  return path, ''
+
+
+def exists( path:str ):
+  archive, member = split_member( path )
+  if member is None: return os.path.exists( path )
+  if not os.path.isfile( archive ): return False
+  with zipfile.ZipFile( archive ) as z: return member in z.namelist()
+
+
+def detect( path:str ):
+  archive, member = split_member( path )
+  if member is not None: return 'zip'
+  with open( path, 'rb' ) as f: head = f.read(4)
+  for magic, kind in MAGIC.items():
+    if head.startswith( magic ): return kind
+  return None
+
+
+def open_source( path:str ):
+  # seekable binary stream of the decompressed product
+  kind = detect( path )
+  if kind is None:   return open( path, 'rb' )
+  if kind == 'gzip': return io.BufferedReader( GzipReader( path ), CHUNK_SIZE )
+  if kind == 'bz2':  return bz2.open( path, 'rb' )
+
+  archive, member = split_member( path )
+  z = zipfile.ZipFile( archive )
+  if member is None:
+    names = [ n for n in z.namelist() if not n.endswith('/') ]
+    if len(names) != 1:
+      z.close()
+      raise ValueError( f"Zip archive {archive} holds {len(names)} files, name one as '{archive}/<member>'" )
+    member = names[0]
+  return z.open( member )       # the archive stays open until the member stream is closed
+
+
+def open_label( path:str ):
+  # text lines for ODL.parse, decompression stops where the parser stops reading
+  return LabelReader( open_source( path ) )
+
+
+class LabelReader(object):
+  # Lines are decoded one at a time, so binary data following an embedded
+  # label only fails on the first binary line, never on the END line before it.
+
+  def __init__( self, stream, encoding:str = 'utf-8' ):
+    self.stream = stream
+    self.encoding = encoding
+
+  def __iter__( self ): return self
+
+  def __next__( self ):
+    line = self.stream.readline( CHUNK_SIZE )
+    if not line: raise StopIteration
+    return line.decode( self.encoding ).replace( '\r\n', '\n' )
+
+  def __enter__( self ): return self
+  def __exit__( self, *exc ): self.close()
+  def close( self ): self.stream.close()
+
+
+class GzipIndex(object):
+
+  def __init__( self, spacing:int = CHECKPOINT_SPACING, limit:int = CHECKPOINTS_PER_FILE ):
+    self.spacing = spacing
+    self.limit   = limit
+    self.snapshots = 0                # decompressor snapshots held, member starts cost none
+    self.offsets = [ 0 ]              # uncompressed offset of each checkpoint, for bisect
+    self.points  = [ ( 0, 0, None ) ] # ( uncompressed offset, compressed offset, decompressor snapshot )
+    self.length  = None               # uncompressed size, known once the stream end was reached
+    self.lock    = threading.Lock()
+
+  def add( self, upos:int, cpos:int, snapshot ):
+    # points grow before offsets, so a lock free checkpoint() never bisects past the end of points
+    with self.lock:
+      if snapshot is not None and self.snapshots >= self.limit: return
+      if upos > self.offsets[-1]:
+        self.points.append( ( upos, cpos, snapshot ) )
+        self.offsets.append( upos )
+        self.snapshots += snapshot is not None
+
+  def checkpoint( self, offset:int ):
+    return self.points[ bisect.bisect_right( self.offsets, offset ) - 1 ]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def gzip_index( path:str ):
+  # one index per file version, shared by every reader in the process
+  #   spacing grows with the file so a ~4:1 stream spreads its snapshots over the whole length,
+  #   older versions of a growing file are dropped, least recently used indexes go once the process
+  #   holds more than INDEX_CACHE_SIZE indexes or SNAPSHOT_BUDGET snapshots
+  st = os.stat( path )
+  key = ( os.path.realpath( path ), st.st_size, st.st_mtime_ns )
+  with _indexes_lock:
+    index = _indexes.pop( key, None ) or GzipIndex( max( CHECKPOINT_SPACING, 4*st.st_size // CHECKPOINTS_PER_FILE ) )
+    for stale in [ k for k in _indexes if k[0] == key[0] ]: del _indexes[stale]
+    _indexes[key] = index
+    while len(_indexes) > INDEX_CACHE_SIZE or \
+          len(_indexes) > 1 and sum( i.snapshots for i in _indexes.values() ) > SNAPSHOT_BUDGET:
+      _indexes.pop( next(iter(_indexes)) )
+  return index
+
+
+class _Cursor(object):
+
+  def __init__( self, point ):
+    self.upos, self.cpos, snapshot = point
+    self.d = snapshot.copy() if snapshot is not None else zlib.decompressobj( 31 )
+    self.pending = b''          # compressed bytes read from cpos on, not yet consumed
+
+
+class GzipReader(io.RawIOBase):
+  # Python's zlib cannot resume inflate at a bit offset, so checkpoints are
+  # decompressor snapshots held in memory rather than a file on disk.
+  # They are recorded while reading, later reads start from the nearest one.
+
+  def __init__( self, path:str, index:GzipIndex = None ):
+    self.file   = open( path, 'rb' )
+    self.index  = index or gzip_index( path )
+    self.pos    = 0
+    self.cursor = None
+
+  def readable( self ): return True
+  def seekable( self ): return True
+  def tell( self ): return self.pos
+
+  def close( self ):
+    if not self.closed: self.file.close()
+    super().close()
+
+  def seek( self, offset:int, whence:int = io.SEEK_SET ):
+    if whence == io.SEEK_CUR: offset += self.pos
+    elif whence == io.SEEK_END: offset += self.size()
+    if offset < 0: raise ValueError( f'Negative seek position {offset}' )
+    self.pos = offset
+    return self.pos
+
+  def size( self ):
+    if self.index.length is None:
+      self._move( self.index.offsets[-1] )
+      while self._inflate( CHUNK_SIZE ): pass
+    return self.index.length
+
+  def readinto( self, buf ):
+    view = memoryview( buf ).cast( 'B' )
+    n = 0
+    if self._move( self.pos ):
+      while n < len(view):
+        data = self._inflate( len(view) - n )
+        if not data: break
+        view[ n:n+len(data) ] = data
+        n += len(data)
+    self.pos += n
+    return n
+
+  def _move( self, offset:int ):
+    # bring the cursor to offset, False when offset is past the end of the stream
+    point = self.index.checkpoint( offset )
+    c = self.cursor
+    if c is None or c.upos > offset or c.upos < point[0]:
+      c = self.cursor = _Cursor( point )
+    while c.upos < offset:
+      if not self._inflate( offset - c.upos ): return False
+    return True
+
+  def _fill( self ):
+    c = self.cursor
+    self.file.seek( c.cpos + len(c.pending) )
+    c.pending += self.file.read( CHUNK_SIZE )
+
+  def _inflate( self, limit:int ):
+    # next block of output, at most limit bytes and never across a checkpoint, b'' at the end
+    c = self.cursor
+    spacing = self.index.spacing
+    limit = min( limit, spacing - c.upos % spacing )
+    while True:
+      if c.d.eof:
+        if len(c.pending) < 2: self._fill()
+        if not c.pending.startswith( b'\x1f\x8b' ):   # trailing padding is ignored, as gzip does
+          self.index.length = c.upos
+          return b''
+        c.d = zlib.decompressobj( 31 )
+        self.index.add( c.upos, c.cpos, None )        # member start is a clean restart point
+      if not c.pending:
+        self._fill()
+        if not c.pending: raise EOFError( 'Compressed file ended before the end-of-stream marker was reached' )
+      data = c.d.decompress( c.pending, limit )
+      rest = c.d.unused_data if c.d.eof else c.d.unconsumed_tail
+      c.cpos += len(c.pending) - len(rest)
+      c.pending = rest
+      if data:
+        c.upos += len(data)
+        if c.upos % spacing == 0: self.index.add( c.upos, c.cpos, c.d.copy() )
+        return data
@@ -1,5 +1,6 @@
 import os
 import odl
+import compressed
 import numpy as np
 
 
@@ -23,11 +24,24 @@ def odl_type_to_numpy_dtype( sample_type, sample_bits ):
   return f'{dtype_prefix}{sample_bits//8}'
 
 
+def read_array( path:str, dtype, count:int, offset:int = 0 ):
+
+  if compressed.detect( path ) is None:
+    return np.fromfile( path, dtype, count=count, offset=offset )
+
+  # compressed sources are decompressed straight into the array
+  data = np.empty( count, dtype )
+  with compressed.open_source( path ) as infile:
+    infile.seek( offset )
+    n = infile.readinto( data.view( np.uint8 ) )
+  return data[ :n // data.itemsize ]
+
+
 
 def read_img( img_path:str ):
 
   label_parser = odl.ODL()
-  with open( img_path, 'r' ) as infile: label_parser.parse( infile )
+  with compressed.open_label( img_path ) as infile: label_parser.parse( infile )
 
   record_size   = label_parser.get( 'RECORD_BYTES', int )
   image_ptr     = label_parser.get( '^IMAGE', int )
@@ -39,14 +53,24 @@ def read_img( img_path:str ):
   band_storage  = label_parser.get( 'IMAGE/BAND_STORAGE_TYPE' )
 
   dtype = odl_type_to_numpy_dtype(sample_type,sample_bits) 
-  data = np.fromfile( img_path, dtype, count=lines*samples*num_bands, offset=(image_ptr-1)*record_size )
+  data = read_array( img_path, dtype, count=lines*samples*num_bands, offset=(image_ptr-1)*record_size )
   return data.reshape( (num_bands, lines, samples) )
 
 
+def infer_img_path( lbl_path:str ):
+
+  # X.LBL -> X.IMG, X.LBL.gz -> X.IMG.gz or X.IMG
+  base, ext = compressed.split_ext( lbl_path )
+  candidates = [ base[:-4]+'.IMG'+ext, base[:-4]+'.IMG' ]
+  for path in candidates:
+    if compressed.exists( path ): return path
+  return candidates[0]
+
+
 def read_lbl_img( lbl_path:str, img_path:str = None ):
 
   label_parser = odl.ODL()
-  with open( lbl_path, 'r' ) as infile: label_parser.parse( infile )
+  with compressed.open_label( lbl_path ) as infile: label_parser.parse( infile )
 
   record_size   = label_parser.get( 'RECORD_BYTES', int )
   image_ptr     = label_parser.get( '^IMAGE', str )
@@ -58,7 +82,7 @@ def read_lbl_img( lbl_path:str, img_path:str = None ):
   band_storage  = label_parser.get( 'IMAGE/BAND_STORAGE_TYPE' )
 
 
-  img_path = img_path or lbl_path[:-4]+'.IMG'
+  img_path = img_path or infer_img_path( lbl_path )
   dtype = odl_type_to_numpy_dtype(sample_type,sample_bits) 
-  data = np.fromfile( img_path, dtype=dtype, count=lines*samples*num_bands, offset=0 )
+  data = read_array( img_path, dtype, count=lines*samples*num_bands, offset=0 )
   return data.reshape( (num_bands, lines, samples) )
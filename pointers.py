@@ -0,0 +1,44 @@
+# File pointers in PDS3 labels
+#   ^IMAGE = 12 | 12 <BYTES> | "X.IMG" | ("X.IMG", 12) | ("X.IMG", 12 <BYTES>)
+#   a detached label names its data file through any top level ^<OBJECT> pointer
+#   named files are found in either case and as gzip / bz2 copies
+
+
+import os
+import re
+
+
+INCLUDES = ( '^STRUCTURE', '^DESCRIPTION' )  # include files, not data
+
+
+def parse_pointer( pointer:str ):
+  # ( file name or None, location, in bytes )
+  name, location, in_bytes = None, 1, False
+  for part in pointer.strip().strip( '()' ).split( ',' ):
+    part = part.strip()
+    if part.startswith( '"' ):
+      name = part.strip( '"' )
+    elif part:
+      in_bytes = part.upper().endswith( '<BYTES>' )
+      location = int( re.match( r'\d+', part ).group() )
+  return name, location, in_bytes
+
+
+def detached_file( label:dict ):
+  # data file named by a top level pointer, ^IMAGE first, then ^INDEX_TABLE, ^TABLE, ^SERIES ...
+  # ^STRUCTURE, ^DESCRIPTION and catalog pointers name include files, not data
+  keys = [ k for k in label if k.startswith( '^' ) and k not in INCLUDES and not k.endswith( '_CATALOG' ) ]
+  for key in sorted( keys, key=lambda k: k != '^IMAGE' ):
+    name = parse_pointer( label[key] )[0]
+    if name: return name
+  return None
+
+
+def resolve( directory:str, name:str ):
+  # data file named in a label, allowing for mirrors in either case and compressed copies,
+  # the path as named when none exists
+  for candidate in ( name, name.lower(), name.upper() ):
+    for ext in ( '', '.gz', '.bz2' ):
+      path = os.path.join( directory, candidate + ext )
+      if os.path.exists( path ): return path
+  return os.path.join( directory, name )
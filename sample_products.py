@@ -0,0 +1,44 @@
+# Synthetic PDS3 products for the tests, built in memory
+#   label_text()   label with an IMAGE object, attached ( ^IMAGE = record ) or detached ( ^IMAGE = "X.IMG" )
+#   image_bytes()  deterministic 8 or 16 bit samples for that geometry
+#   embedded_img() label padded to LABEL_RECORDS, then the image padded to whole records
+
+
+RECORD_BYTES = 100
+
+
+def label_text( file_records, image_pointer, extra=(), label_records=None, record_bytes=RECORD_BYTES,
+                lines=10, line_samples=100, bands=1, sample_bits=8 ):
+  # label text as bytes, extra lines go in before the IMAGE object
+  return '\r\n'.join([
+    'PDS_VERSION_ID = PDS3',
+    'RECORD_TYPE = FIXED_LENGTH',
+    f'RECORD_BYTES = {record_bytes}',
+    f'FILE_RECORDS = {file_records}',
+    *( [ f'LABEL_RECORDS = {label_records}' ] if label_records else [] ),
+    f'^IMAGE = {image_pointer}',
+    *extra,
+    'OBJECT = IMAGE',
+    f'  LINES = {lines}',
+    f'  LINE_SAMPLES = {line_samples}',
+    '  SAMPLE_TYPE = UNSIGNED_INTEGER',
+    f'  SAMPLE_BITS = {sample_bits}',
+    f'  BANDS = {bands}',
+    'END_OBJECT = IMAGE',
+    'END',
+    '' ]).encode()
+
+
+def image_bytes( lines=10, line_samples=100, bands=1, sample_bits=8 ):
+  # band sequential samples counting up modulo 251, 1000 bytes for the default geometry
+  return bytes( i % 251 for i in range( bands*lines*line_samples*sample_bits//8 ) )
+
+
+def embedded_img( extra=(), label_records=3, record_bytes=RECORD_BYTES, **geometry ):
+  # IMG product with an embedded label, 1300 bytes for the defaults
+  image = image_bytes( **geometry )
+  image_records = -( -len(image) // record_bytes )
+  label = label_text( label_records + image_records, label_records + 1, extra, label_records, record_bytes, **geometry )
+  if len(label) > label_records*record_bytes:
+    raise ValueError( f'Label of {len(label)} bytes does not fit {label_records} records' )
+  return label.ljust( label_records*record_bytes, b' ' ) + image.ljust( image_records*record_bytes, b'\0' )
@@ -0,0 +1,260 @@
+# Decoded image cache shared between worker processes
+#   arrays live in multiprocessing.shared_memory segments, workers attach zero copy
+#   one control segment holds the LRU table, reference counts and statistics
+#   create the cache in the parent, hand it to workers via Process / Pool initializer args
+
+
+import os
+import sys
+import struct
+import hashlib
+import secrets
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+import img
+
+
+MAX_DIMS = 4
+
+# budget, used, clock, hits, misses, evictions, slots
+HEADER = struct.Struct( '<7Q' )
+# state, key digest, nbytes, refs, last used, dtype, ndim, shape, owner pid
+SLOT   = struct.Struct( f'<B20sQqQ8sB{MAX_DIMS}Qi' )
+
+FREE, FILLING, READY = 0, 1, 2
+
+
+def _segment( name:str, create:bool = False, size:int = 0 ):
+  # segments belong to the cache, not to the process that happens to create or attach them
+  if sys.version_info >= (3, 13):
+    return shared_memory.SharedMemory( name, create, size, track=False )
+  shm = shared_memory.SharedMemory( name, create, size )
+  resource_tracker.unregister( shm._name, 'shared_memory' )
+  return shm
+
+
+def _destroy( shm ):
+  shm.close()
+  if sys.version_info < (3, 13):
+    resource_tracker.register( shm._name, 'shared_memory' )   # unlink() unregisters it again
+  shm.unlink()
+
+
+def _unlink( name:str ):
+  try:
+    _destroy( _segment( name ) )
+  except FileNotFoundError:
+    pass
+
+
+def _alive( pid:int ):
+  try:
+    os.kill( pid, 0 )
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def cache_key( path:str, reader ):
+  # a product rewritten in place gets a new key, the stale entry ages out
+  st = os.stat( path )
+  key = f'{os.path.realpath(path)}\0{st.st_size}\0{st.st_mtime_ns}\0{reader.__module__}.{reader.__qualname__}'
+  return hashlib.sha1( key.encode() ).digest()
+
+
+class Lease(object):
+
+  def __init__( self, cache, slot, shm, array ):
+    self.cache = cache
+    self.slot  = slot
+    self.shm   = shm
+    self.array = array
+
+  def __enter__( self ): return self.array
+  def __exit__( self, *exc ): self.release()
+
+  def release( self ):
+    # views of the array kept past release may outlive the entry, copy what must be kept
+    if self.slot is None: return
+    self.array = None
+    try:
+      self.shm.close()
+    except BufferError:
+      pass                                        # caller still holds a view, the mapping goes with it
+    self.cache._release( self.slot )
+    self.slot = None
+
+
+class ImageCache(object):
+
+  def __init__( self, budget:int, slots:int = 1024, name:str = None ):
+    self.name  = name or 'odl_' + secrets.token_hex(4)
+    self.slots = slots
+    self.lock  = multiprocessing.Lock()
+    self.control = _segment( self.name, create=True, size=HEADER.size + slots*SLOT.size )
+    self.control.buf[:] = bytes( len(self.control.buf) )
+    HEADER.pack_into( self.control.buf, 0, budget, 0, 0, 0, 0, 0, slots )
+
+  # the lock can only be passed on while starting processes, the control block is attached by name
+  def __getstate__( self ):
+    return { 'name': self.name, 'slots': self.slots, 'lock': self.lock }
+
+  def __setstate__( self, state ):
+    self.__dict__.update( state )
+    self.control = _segment( self.name )
+
+  def acquire( self, path:str, reader = img.read_img ):
+    # lease on the decoded array of path, release it ( or use as context manager ) when done
+    key = cache_key( path, reader )
+    with self.lock:
+      slot = self._find( key, ready_only=True )
+      if slot is not None:
+        self._touch( slot, refs=1 )
+        self._count( hits=1 )
+        fields = self._slot( slot )
+      else:
+        self._count( misses=1 )
+
+    if slot is not None:
+      try:
+        shm = _segment( self._segment_name( key ) )
+      except BaseException:                       # unlinked meanwhile, hand the reference back
+        self._release( slot )
+        raise
+      return Lease( self, slot, shm, self._array( shm, fields ) )
+
+    array = np.ascontiguousarray( reader( path ) )
+    return self._insert( key, array )
+
+  def stats( self ):
+    with self.lock:
+      budget, used, _, hits, misses, evictions, _ = HEADER.unpack_from( self.control.buf, 0 )
+      entries = sum( 1 for i in range(self.slots) if self._slot(i)[0] == READY )
+    return { 'budget': budget, 'used': used, 'entries': entries,
+             'hits': hits, 'misses': misses, 'evictions': evictions }
+
+  def close( self ):
+    self.control.close()
+
+  def unlink( self ):
+    # owner only: drop every segment, live leases keep their mapping until released
+    with self.lock:
+      for i in range(self.slots):
+        if self._slot(i)[0] != FREE: _unlink( self._segment_name( self._slot(i)[1] ) )
+    _destroy( self.control )
+
+  def _insert( self, key:bytes, array ):
+    with self.lock:
+      slot = None
+      self._reap()
+      if self._find( key ) is None:               # another worker may have decoded it meanwhile
+        slot = self._reserve( key, array )
+    if slot is None:
+      return Lease( self, None, None, array )
+
+    name = self._segment_name( key )
+    try:
+      try:
+        shm = _segment( name, create=True, size=array.nbytes )
+      except FileExistsError:                     # left behind by a crashed worker
+        _unlink( name )
+        shm = _segment( name, create=True, size=array.nbytes )
+    except BaseException:
+      with self.lock: self._free( slot, evicted=False )
+      raise
+    cached = self._array( shm, self._slot( slot ) )
+    cached[...] = array
+    with self.lock:
+      self._write( slot, state=READY )
+    return Lease( self, slot, shm, cached )
+
+  def _reserve( self, key:bytes, array ):
+    # make room under the lock, None when pinned entries leave no room
+    budget, used = HEADER.unpack_from( self.control.buf, 0 )[:2]
+    if not 0 < array.nbytes <= budget or array.ndim > MAX_DIMS: return None
+    free = self._vacant()
+    while used + array.nbytes > budget or free is None:
+      victim = self._lru()
+      if victim is None: return None
+      _unlink( self._segment_name( self._slot(victim)[1] ) )
+      self._free( victim, evicted=True )
+      used = HEADER.unpack_from( self.control.buf, 0 )[1]
+      if free is None: free = victim
+
+    shape = tuple(array.shape) + (0,)*( MAX_DIMS - array.ndim )
+    SLOT.pack_into( self.control.buf, self._offset(free), FILLING, key, array.nbytes, 1, 0,
+                    array.dtype.str.encode(), array.ndim, *shape, os.getpid() )
+    self._touch( free )
+    self._count( used=array.nbytes )
+    return free
+
+  def _release( self, slot:int ):
+    with self.lock: self._touch( slot, refs=-1 )
+
+  def _free( self, slot:int, evicted:bool ):
+    nbytes = self._slot( slot )[2]
+    self.control.buf[ self._offset(slot):self._offset(slot)+SLOT.size ] = bytes( SLOT.size )
+    self._count( used=-nbytes, evictions=int(evicted) )
+
+  def _reap( self ):
+    # entries left FILLING by a worker that died before finishing them
+    for i in range(self.slots):
+      fields = self._slot(i)
+      if fields[0] == FILLING and not _alive( fields[-1] ):
+        _unlink( self._segment_name( fields[1] ) )
+        self._free( i, evicted=False )
+
+  def _lru( self ):
+    # least recently used entry nobody holds
+    best = None
+    for i in range(self.slots):
+      state, _, _, refs, last = self._slot(i)[:5]
+      if state == READY and refs == 0 and ( best is None or last < best[1] ): best = ( i, last )
+    return best and best[0]
+
+  def _find( self, key:bytes, ready_only:bool = False ):
+    for i in range(self.slots):
+      state, digest = self._slot(i)[:2]
+      if state != FREE and digest == key and ( state == READY or not ready_only ): return i
+    return None
+
+  def _vacant( self ):
+    for i in range(self.slots):
+      if self._slot(i)[0] == FREE: return i
+    return None
+
+  def _touch( self, slot:int, refs:int = 0 ):
+    clock = HEADER.unpack_from( self.control.buf, 0 )[2] + 1
+    self._count( clock=1 )
+    fields = list( self._slot(slot) )
+    fields[3] += refs
+    fields[4] = clock
+    SLOT.pack_into( self.control.buf, self._offset(slot), *fields )
+
+  def _write( self, slot:int, state:int ):
+    fields = list( self._slot(slot) )
+    fields[0] = state
+    SLOT.pack_into( self.control.buf, self._offset(slot), *fields )
+
+  def _count( self, used=0, clock=0, hits=0, misses=0, evictions=0 ):
+    h = list( HEADER.unpack_from( self.control.buf, 0 ) )
+    for i, delta in enumerate( (0, used, clock, hits, misses, evictions, 0) ): h[i] += delta
+    HEADER.pack_into( self.control.buf, 0, *h )
+
+  def _slot( self, slot:int ):
+    return SLOT.unpack_from( self.control.buf, self._offset(slot) )
+
+  def _offset( self, slot:int ):
+    return HEADER.size + slot*SLOT.size
+
+  def _segment_name( self, key:bytes ):
+    return f'{self.name}_{key.hex()[:16]}'
+
+  @staticmethod
+  def _array( shm, fields ):
+    dtype, ndim, shape = fields[5], fields[6], fields[7:7+MAX_DIMS]
+    return np.ndarray( shape[:ndim], np.dtype( dtype.rstrip(b'\0').decode() ), buffer=shm.buf )
@@ -0,0 +1,190 @@
+import unittest
+import numpy as np
+import os
+import io
+import bz2
+import gzip
+import shutil
+import zipfile
+import tempfile
+from unittest import mock
+
+import compressed
+import img
+import odl
+import sample_products
+
+
+GEOMETRY = dict( lines=12, line_samples=160, bands=3 )
+
+
+class TestGzipReader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.payload = os.urandom( 40000 ) + bytes( 200000 ) + os.urandom( 30000 )
+        cls.path = os.path.join( cls.tmp, 'payload.gz' )
+        with gzip.open( cls.path, 'wb' ) as f: f.write( cls.payload )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree( cls.tmp )
+
+    def test_random_reads_match_payload(self):
+        index = compressed.GzipIndex( spacing=4096 )
+        reader = io.BufferedReader( compressed.GzipReader( self.path, index ) )
+        for offset, size in [ (0, 100), (250000, 5000), (4095, 2), (100000, 70000), (269990, 100) ]:
+            with self.subTest(offset=offset):
+                reader.seek( offset )
+                self.assertEqual( reader.read( size ), self.payload[offset:offset+size] )
+        reader.close()
+
+    def test_checkpoints_recorded_and_reused(self):
+        index = compressed.GzipIndex( spacing=8192 )
+        with compressed.GzipReader( self.path, index ) as reader:
+            reader.seek( 200000 )
+            reader.read( 10 )
+        self.assertEqual( index.offsets[-1], 196608 )
+
+        # a second reader starts from the nearest checkpoint, not from the start of the stream
+        with compressed.GzipReader( self.path, index ) as reader:
+            reader.seek( 200000 )
+            self.assertEqual( reader.read( 1000 ), self.payload[200000:201000] )
+            self.assertEqual( reader.cursor.upos - 1000, 200000 )
+
+    def test_seek_end_and_read_past_end(self):
+        with compressed.GzipReader( self.path, compressed.GzipIndex( spacing=8192 ) ) as reader:
+            self.assertEqual( reader.seek( 0, io.SEEK_END ), len(self.payload) )
+            self.assertEqual( reader.read( 10 ), b'' )
+            reader.seek( -10, io.SEEK_END )
+            self.assertEqual( reader.read(), self.payload[-10:] )
+
+    def test_multi_member_stream(self):
+        path = os.path.join( self.tmp, 'members.gz' )
+        with open( path, 'wb' ) as f:
+            f.write( gzip.compress( b'first member ' ) + gzip.compress( b'second member' ) + bytes(8) )
+        index = compressed.GzipIndex()
+        with compressed.GzipReader( path, index ) as reader:
+            self.assertEqual( reader.read(), b'first member second member' )
+        self.assertEqual( index.offsets, [ 0, 13 ] )
+        self.assertEqual( index.length, 26 )
+
+    def test_snapshot_limit_per_index(self):
+        index = compressed.GzipIndex( spacing=4096, limit=5 )
+        with compressed.GzipReader( self.path, index ) as reader:
+            reader.seek( 100000 )
+            self.assertEqual( reader.read( 100 ), self.payload[100000:100100] )
+        self.assertEqual( ( index.snapshots, index.offsets[-1] ), ( 5, 5*4096 ) )
+
+    def test_index_cache_snapshot_budget(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join( self.tmp, f'budget{i}.gz' )
+            shutil.copy( self.path, path )
+            paths.append( path )
+        with mock.patch.multiple( compressed, CHECKPOINT_SPACING=4096, SNAPSHOT_BUDGET=100 ), \
+             mock.patch.dict( compressed._indexes, clear=True ):
+            for path in paths:
+                with compressed.GzipReader( path ) as reader: reader.read()
+            self.assertEqual( sum( i.snapshots for i in compressed._indexes.values() ), 2*65 )
+            self.assertEqual( compressed.gzip_index( paths[0] ).snapshots, 0 )   # its old index was dropped
+            self.assertEqual( len( compressed._indexes ), 2 )
+
+    def test_index_cache_entry_cap(self):
+        with mock.patch.dict( compressed._indexes, clear=True ):
+            for i in range( compressed.INDEX_CACHE_SIZE + 10 ):
+                path = os.path.join( self.tmp, f'small{i}.gz' )
+                with open( path, 'wb' ) as f: f.write( gzip.compress( b'small' ) )
+                with compressed.GzipReader( path ) as reader: reader.read()
+            self.assertEqual( len( compressed._indexes ), compressed.INDEX_CACHE_SIZE )
+
+            growing = os.path.join( self.tmp, 'growing.gz' )
+            for i in range(3):
+                with open( growing, 'ab' ) as f: f.write( gzip.compress( b'more' ) )
+                compressed.gzip_index( growing )
+            self.assertEqual( sum( 1 for k in compressed._indexes if k[0] == os.path.realpath( growing ) ), 1 )
+
+    def test_truncated_stream(self):
+        path = os.path.join( self.tmp, 'truncated.gz' )
+        with open( self.path, 'rb' ) as f, open( path, 'wb' ) as out:
+            out.write( f.read( 1000 ) )
+        with compressed.GzipReader( path ) as reader:
+            with self.assertRaises( EOFError ):
+                reader.read()
+
+
+class TestCompressedSources(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.img_path = os.path.join( self.tmp, 'PRODUCT.IMG' )
+        self.raw = sample_products.embedded_img( **GEOMETRY )
+        self.data = np.frombuffer( sample_products.image_bytes( **GEOMETRY ), '>u1' ).reshape( (3, 12, 160) )
+        with open( self.img_path, 'wb' ) as f: f.write( self.raw )
+
+    def tearDown(self):
+        shutil.rmtree( self.tmp )
+
+    def test_detect(self):
+        gz = os.path.join( self.tmp, 'PRODUCT.IMG.gz' )
+        bz = os.path.join( self.tmp, 'PRODUCT.IMG.bz2' )
+        zp = os.path.join( self.tmp, 'VOLUME.zip' )
+        with open( gz, 'wb' ) as f: f.write( gzip.compress( self.raw ) )
+        with open( bz, 'wb' ) as f: f.write( bz2.compress( self.raw ) )
+        with zipfile.ZipFile( zp, 'w' ) as z: z.writestr( 'DATA/PRODUCT.IMG', self.raw )
+
+        self.assertIsNone( compressed.detect( self.img_path ) )
+        self.assertEqual( compressed.detect( gz ), 'gzip' )
+        self.assertEqual( compressed.detect( bz ), 'bz2' )
+        self.assertEqual( compressed.detect( zp ), 'zip' )
+        self.assertEqual( compressed.detect( zp + '/DATA/PRODUCT.IMG' ), 'zip' )
+
+    def test_read_img_from_each_format(self):
+        sources = {}
+        sources['gzip'] = os.path.join( self.tmp, 'PRODUCT.IMG.gz' )
+        with open( sources['gzip'], 'wb' ) as f: f.write( gzip.compress( self.raw ) )
+        sources['bz2'] = os.path.join( self.tmp, 'PRODUCT.IMG.bz2' )
+        with open( sources['bz2'], 'wb' ) as f: f.write( bz2.compress( self.raw ) )
+        zp = os.path.join( self.tmp, 'VOLUME.zip' )
+        with zipfile.ZipFile( zp, 'w', zipfile.ZIP_DEFLATED ) as z:
+            z.writestr( 'DATA/PRODUCT.IMG', self.raw )
+            z.writestr( 'DATA/OTHER.IMG', b'' )
+        sources['zip'] = zp + '/DATA/PRODUCT.IMG'
+
+        for kind, path in sources.items():
+            with self.subTest(kind=kind):
+                image_data = img.read_img( img_path=path )
+                self.assertEqual( image_data.shape, self.data.shape )
+                self.assertTrue( np.array_equal( image_data, self.data ) )
+
+    def test_zip_requires_member_name(self):
+        zp = os.path.join( self.tmp, 'VOLUME.zip' )
+        with zipfile.ZipFile( zp, 'w' ) as z:
+            z.writestr( 'A.IMG', b'a' )
+            z.writestr( 'B.IMG', b'b' )
+        with self.assertRaises( ValueError ):
+            compressed.open_source( zp )
+
+    def test_read_lbl_img_gzip_pair(self):
+        lbl_path = os.path.join( self.tmp, 'PRODUCT.LBL.gz' )
+        header = sample_products.label_text( 58, '"PRODUCT.IMG"', **GEOMETRY )
+        with open( lbl_path, 'wb' ) as f: f.write( gzip.compress( header ) )
+        with open( os.path.join( self.tmp, 'PRODUCT.IMG.gz' ), 'wb' ) as f:
+            f.write( gzip.compress( self.data.tobytes() ) )
+
+        self.assertEqual( img.infer_img_path( lbl_path ), os.path.join( self.tmp, 'PRODUCT.IMG.gz' ) )
+        image_data = img.read_lbl_img( lbl_path=lbl_path )
+        self.assertTrue( np.array_equal( image_data, self.data ) )
+
+    def test_label_parse_reads_only_the_head(self):
+        path = os.path.join( self.tmp, 'PRODUCT.IMG.gz' )
+        with open( path, 'wb' ) as f: f.write( gzip.compress( self.raw + os.urandom( 4 << 20 ) ) )
+        with compressed.open_label( path ) as infile:
+            label = odl.ODL().parse( infile )
+            self.assertLess( infile.stream.raw.cursor.upos, 1 << 20 )
+        self.assertEqual( label['IMAGE/LINES'], '12' )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import pointers
+
+
+class TestPointers(unittest.TestCase):
+
+    def test_parse_pointer(self):
+        cases = [
+            ( '12',                    ( None, 12, False ) ),
+            ( '1201 <BYTES>',          ( None, 1201, True ) ),
+            ( '"X.IMG"',               ( 'X.IMG', 1, False ) ),
+            ( '("X.IMG", 5)',          ( 'X.IMG', 5, False ) ),
+            ( '("X.IMG",301<BYTES>)',  ( 'X.IMG', 301, True ) ),
+        ]
+        for pointer, expected in cases:
+            with self.subTest(pointer=pointer):
+                self.assertEqual( pointers.parse_pointer( pointer ), expected )
+
+    def test_detached_file(self):
+        cases = [
+            ( { '^IMAGE': '4' },                                                None ),
+            ( { '^TABLE': '"T.TAB"', '^IMAGE': '("X.IMG", 2)' },                'X.IMG' ),
+            ( { '^INDEX_TABLE': '"INDEX.TAB"', 'INDEX_TABLE/^STRUCTURE': '"INDEX.FMT"' }, 'INDEX.TAB' ),
+            ( { '^STRUCTURE': '"A.FMT"', '^DATA_SET_CATALOG': '"DS.CAT"' },     None ),
+        ]
+        for label, expected in cases:
+            with self.subTest(label=label):
+                self.assertEqual( pointers.detached_file( label ), expected )
+
+    def test_resolve(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for name in ( 'a.img', 'B.TAB.gz' ):
+                open( os.path.join( tmp, name ), 'wb' ).close()
+            self.assertEqual( pointers.resolve( tmp, 'A.IMG' ), os.path.join( tmp, 'a.img' ) )
+            self.assertEqual( pointers.resolve( tmp, 'b.tab' ), os.path.join( tmp, 'B.TAB.gz' ) )
+            self.assertEqual( pointers.resolve( tmp, 'C.IMG' ), os.path.join( tmp, 'C.IMG' ) )
+        finally:
+            shutil.rmtree( tmp )
+
+
+if __name__ == '__main__':
+    unittest.main()
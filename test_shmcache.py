@@ -0,0 +1,117 @@
+import unittest
+import numpy as np
+import os
+import shutil
+import tempfile
+import multiprocessing
+from unittest import mock
+
+import shmcache
+
+
+def read_npy( path ):
+    return np.load( path )
+
+
+def worker_sum( cache, path, queue ):
+    with cache.acquire( path, reader=read_npy ) as array:
+        queue.put( int( array.sum() ) )
+    cache.close()
+
+
+def worker_dies_filling( cache, path ):
+    key = shmcache.cache_key( path, read_npy )
+    with cache.lock: cache._reserve( key, read_npy( path ) )
+    os._exit( 0 )
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = shmcache.ImageCache( budget=3000, slots=8 )
+        self.paths = []
+        for i in range(4):
+            path = os.path.join( self.tmp, f'image{i}.npy' )
+            np.save( path, np.full( (1, 10, 100), i, dtype='>u1' ) )  # 1000 bytes each
+            self.paths.append( path )
+
+    def tearDown(self):
+        self.cache.unlink()
+        shutil.rmtree( self.tmp )
+
+    def test_hit_shares_memory(self):
+        first = self.cache.acquire( self.paths[0], reader=read_npy )
+        second = self.cache.acquire( self.paths[0], reader=read_npy )
+        self.assertEqual( second.array.dtype, np.dtype('>u1') )
+        self.assertEqual( second.array.shape, (1, 10, 100) )
+        first.array[0, 0, 0] = 42
+        self.assertEqual( second.array[0, 0, 0], 42 )
+        first.release()
+        second.release()
+        stats = self.cache.stats()
+        self.assertEqual( ( stats['hits'], stats['misses'], stats['entries'], stats['used'] ), ( 1, 1, 1, 1000 ) )
+
+    def test_lru_eviction_within_budget(self):
+        for path in self.paths[:3]:
+            with self.cache.acquire( path, reader=read_npy ): pass
+        with self.cache.acquire( self.paths[0], reader=read_npy ): pass   # image1 is now least recent
+        with self.cache.acquire( self.paths[3], reader=read_npy ): pass
+
+        stats = self.cache.stats()
+        self.assertEqual( ( stats['evictions'], stats['entries'], stats['used'] ), ( 1, 3, 3000 ) )
+        with self.cache.acquire( self.paths[0], reader=read_npy ): pass
+        with self.cache.acquire( self.paths[1], reader=read_npy ): pass
+        self.assertEqual( self.cache.stats()['hits'], 2 )
+
+    def test_leased_entries_are_not_evicted(self):
+        leases = [ self.cache.acquire( path, reader=read_npy ) for path in self.paths[:3] ]
+        with self.cache.acquire( self.paths[3], reader=read_npy ) as array:
+            self.assertEqual( array[0, 0, 0], 3 )                      # served uncached
+        stats = self.cache.stats()
+        self.assertEqual( ( stats['evictions'], stats['entries'] ), ( 0, 3 ) )
+        for i, lease in enumerate( leases ):
+            self.assertEqual( lease.array[0, 0, 0], i )
+            lease.release()
+
+    def test_modified_file_is_a_miss(self):
+        with self.cache.acquire( self.paths[0], reader=read_npy ): pass
+        np.save( self.paths[0], np.full( (1, 10, 200), 7, dtype='>u1' ) )
+        with self.cache.acquire( self.paths[0], reader=read_npy ) as array:
+            self.assertEqual( array.shape, (1, 10, 200) )
+        self.assertEqual( self.cache.stats()['misses'], 2 )
+
+    def test_worker_processes_attach(self):
+        with self.cache.acquire( self.paths[2], reader=read_npy ): pass
+        queue = multiprocessing.Queue()
+        workers = [ multiprocessing.Process( target=worker_sum, args=( self.cache, self.paths[2], queue ) ) for _ in range(2) ]
+        for w in workers: w.start()
+        results = [ queue.get( timeout=30 ) for _ in workers ]
+        for w in workers: w.join()
+        self.assertEqual( results, [ 2000, 2000 ] )
+        self.assertEqual( self.cache.stats()['hits'], 2 )
+        with self.cache.acquire( self.paths[2], reader=read_npy ): pass  # segment survived the workers
+        self.assertEqual( self.cache.stats()['hits'], 3 )
+
+    def test_entry_of_dead_worker_is_reclaimed(self):
+        worker = multiprocessing.Process( target=worker_dies_filling, args=( self.cache, self.paths[1] ) )
+        worker.start()
+        worker.join()
+        self.assertEqual( self.cache.stats()['used'], 1000 )          # reserved, never filled
+        with self.cache.acquire( self.paths[1], reader=read_npy ): pass
+        with self.cache.acquire( self.paths[1], reader=read_npy ) as array:
+            self.assertEqual( array[0, 0, 0], 1 )
+        stats = self.cache.stats()
+        self.assertEqual( ( stats['hits'], stats['entries'], stats['used'] ), ( 1, 1, 1000 ) )
+
+    def test_failed_attach_drops_reference(self):
+        with self.cache.acquire( self.paths[0], reader=read_npy ): pass
+        with mock.patch( 'shmcache._segment', side_effect=FileNotFoundError ):
+            with self.assertRaises( FileNotFoundError ):
+                self.cache.acquire( self.paths[0], reader=read_npy )
+        slot = self.cache._find( shmcache.cache_key( self.paths[0], read_npy ) )
+        self.assertEqual( self.cache._slot( slot )[3], 0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+from unittest import mock
+
+import verify
+from sample_products import label_text, image_bytes, embedded_img
+
+
+IMAGE = image_bytes()
+
+
+class TestLabelGeometry(unittest.TestCase):
+
+    def test_image_extent_with_prefix_bytes(self):
+        label = { '^IMAGE': '3', 'RECORD_BYTES': '100', 'IMAGE/LINES': '10', 'IMAGE/LINE_SAMPLES': '50',
+                  'IMAGE/SAMPLE_BITS': '16', 'IMAGE/BANDS': '2', 'IMAGE/LINE_PREFIX_BYTES': '4' }
+        self.assertEqual( verify.image_extent( label ), ( None, 200, 2*10*104 ) )
+
+
+class TestVerifyVolume(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir( os.path.join( self.root, 'DATA' ) )
+
+    def tearDown(self):
+        shutil.rmtree( self.root )
+
+    def write(self, name, data):
+        with open( os.path.join( self.root, name ), 'wb' ) as f: f.write( data )
+
+    def by_product(self, report):
+        return { r['product']: r for r in report['results'] }
+
+    def test_good_and_broken_products(self):
+        self.write( 'DATA/GOOD.IMG', embedded_img() )
+        self.write( 'DATA/SHORT.IMG', embedded_img()[:-150] )
+        self.write( 'DATA/PAIR.LBL', label_text( 10, '"PAIR.IMG"', [ f'MD5_CHECKSUM = "{hashlib.md5(IMAGE).hexdigest()}"' ] ) )
+        self.write( 'DATA/PAIR.IMG', IMAGE )
+        self.write( 'DATA/BADSUM.LBL', label_text( 10, '"BADSUM.IMG"', [ 'MD5_CHECKSUM = "00000000000000000000000000000000"' ] ) )
+        self.write( 'DATA/BADSUM.IMG', IMAGE )
+        self.write( 'DATA/NOLABEL.IMG', IMAGE )
+        self.write( 'DATA/PACKED.IMG.gz', gzip.compress( embedded_img() ) )
+
+        report = verify.verify_volume( self.root, workers=3 )
+        results = self.by_product( report )
+        self.assertEqual( ( report['products'], report['ok'], report['failed'], report['errors'] ), ( 6, 3, 2, 1 ) )
+
+        self.assertEqual( results['DATA/GOOD.IMG']['status'], 'ok' )
+        self.assertEqual( results['DATA/PACKED.IMG.gz']['status'], 'ok' )
+        self.assertEqual( results['DATA/PAIR.LBL']['data'], 'DATA/PAIR.IMG' )
+        self.assertEqual( [ c['check'] for c in results['DATA/PAIR.LBL']['checks'] ], [ 'file_size', 'image_extent', 'md5' ] )
+
+        short = { c['check']: c for c in results['DATA/SHORT.IMG']['checks'] }
+        self.assertEqual( ( short['file_size']['expected'], short['file_size']['actual'] ), ( 1300, 1150 ) )
+        self.assertFalse( short['image_extent']['ok'] )
+        self.assertEqual( results['DATA/BADSUM.LBL']['status'], 'failed' )
+        self.assertIn( 'No ODL label', results['DATA/NOLABEL.IMG']['error'] )
+        self.assertIn( 'DATA/PAIR.IMG', [ r['data'] for r in report['results'] ] )
+        self.assertNotIn( 'DATA/PAIR.IMG', results )                # checked through its label
+
+        json.dumps( report )                                         # report is plain JSON
+
+    def test_manifest_and_process_pool(self):
+        self.write( 'DATA/GOOD.IMG', embedded_img() )
+        self.write( 'DATA/PAIR.LBL', label_text( 10, '("PAIR.IMG", 1)' ) )
+        self.write( 'DATA/PAIR.IMG', IMAGE )
+        os.mkdir( os.path.join( self.root, 'INDEX' ) )
+        self.write( 'INDEX/INDEX.TAB', b'index' )
+        self.write( 'AAREADME.TXT', b'readme' )
+        manifest = os.path.join( self.root, 'MD5.TXT' )
+        with open( manifest, 'w' ) as f:
+            f.write( f'{hashlib.md5( embedded_img() ).hexdigest()}  DATA/GOOD.IMG\n' )
+            f.write( f'{hashlib.md5( b"other" ).hexdigest()} *data/pair.img\n' )
+            f.write( f'{hashlib.md5( b"gone" ).hexdigest()}  DATA/GONE.IMG\n' )
+            f.write( f'{hashlib.md5( b"index" ).hexdigest()}  INDEX/INDEX.TAB\n' )
+            f.write( f'{hashlib.md5( b"stale" ).hexdigest()}  AAREADME.TXT\n' )
+
+        report = verify.verify_volume( self.root, verify.read_manifest( manifest ), workers=2, processes=True )
+        results = self.by_product( report )
+        self.assertEqual( results['DATA/GOOD.IMG']['status'], 'ok' )
+        self.assertEqual( results['DATA/PAIR.LBL']['status'], 'failed' )
+        self.assertEqual( report['missing'], [ 'DATA/GONE.IMG' ] )             # as written in the manifest
+        files = { f['file']: f['status'] for f in report['file_results'] }
+        self.assertEqual( files, { 'INDEX/INDEX.TAB': 'ok', 'AAREADME.TXT': 'failed' } )
+        self.assertEqual( report['files_failed'], 1 )
+        self.assertEqual( report['bytes_read'], 1300 + len( label_text( 10, '("PAIR.IMG", 1)' ) ) + 1000 + 5 + 6 )
+
+    def test_detached_table_and_pointerless_label(self):
+        os.mkdir( os.path.join( self.root, 'INDEX' ) )
+        self.write( 'INDEX/INDEX.LBL', '\r\n'.join([
+            'PDS_VERSION_ID = PDS3',
+            'RECORD_TYPE = FIXED_LENGTH',
+            'RECORD_BYTES = 50',
+            'FILE_RECORDS = 2',
+            '^INDEX_TABLE = "INDEX.TAB"',
+            'OBJECT = INDEX_TABLE',
+            '  ROWS = 2',
+            '  ^STRUCTURE = "INDEX.FMT"',
+            'END_OBJECT = INDEX_TABLE',
+            'END', '' ]).encode() )
+        self.write( 'INDEX/INDEX.TAB', b'x' * 100 )
+        self.write( 'DATA/VOLDESC.LBL', b'PDS_VERSION_ID = PDS3\r\nRECORD_TYPE = FIXED_LENGTH\r\nRECORD_BYTES = 80\r\nFILE_RECORDS = 40\r\nEND\r\n' )
+
+        results = self.by_product( verify.verify_volume( self.root, workers=2 ) )
+        index = results['INDEX/INDEX.LBL']
+        self.assertEqual( index['data'], 'INDEX/INDEX.TAB' )
+        self.assertEqual( [ ( c['check'], c['actual'] ) for c in index['checks'] ], [ ( 'file_size', 100 ) ] )
+        self.assertEqual( index['status'], 'ok' )
+        self.assertEqual( results['DATA/VOLDESC.LBL']['checks'], [] )  # no file_size against the label itself
+        self.assertEqual( results['DATA/VOLDESC.LBL']['status'], 'ok' )
+
+    def test_each_file_is_read_once(self):
+        checksum = hashlib.md5( IMAGE ).hexdigest()
+        self.write( 'DATA/SUMMED.IMG', embedded_img( [ 'MD5_CHECKSUM = "00000000000000000000000000000000"' ], label_records=4 ) )
+        self.write( 'DATA/PACKED.LBL', label_text( 10, '"PACKED.IMG"', [ f'MD5_CHECKSUM = "{checksum}"' ] ) )
+        self.write( 'DATA/PACKED.IMG.gz', gzip.compress( IMAGE ) )
+        manifest = { 'data/summed.img': ( 'DATA/SUMMED.IMG', hashlib.md5( b'' ).hexdigest() ) }
+
+        with mock.patch( 'verify.md5', wraps=verify.md5 ) as md5, mock.patch( 'verify.data_size', wraps=verify.data_size ) as size:
+            report = verify.verify_volume( self.root, manifest, workers=1 )
+        calls = sorted( ( os.path.basename( c.args[0] ), c.kwargs.get( 'decompress', False ) ) for c in md5.call_args_list )
+        self.assertEqual( calls, [ ( 'PACKED.IMG.gz', False ), ( 'PACKED.IMG.gz', True ), ( 'PACKED.LBL', False ), ( 'SUMMED.IMG', False ) ] )
+        self.assertEqual( size.call_count, 0 )
+        results = self.by_product( report )
+        self.assertEqual( [ c['ok'] for c in results['DATA/SUMMED.IMG']['checks'] ], [ True, True, False, False ] )
+        self.assertEqual( results['DATA/PACKED.LBL']['status'], 'ok' )
+
+    def test_embedded_checksum_covers_the_image(self):
+        product = embedded_img( [ f'MD5_CHECKSUM = "{hashlib.md5( IMAGE ).hexdigest()}"' ], label_records=4 )
+        self.write( 'DATA/SUMMED.IMG', product )
+        self.write( 'DATA/PACKED.IMG.gz', gzip.compress( product ) )
+        manifest = { 'data/summed.img': ( 'DATA/SUMMED.IMG', hashlib.md5( product ).hexdigest() ) }
+
+        with mock.patch( 'verify.md5', wraps=verify.md5 ) as md5:
+            report = verify.verify_volume( self.root, manifest, workers=1 )
+        results = self.by_product( report )
+        for product in ( 'DATA/SUMMED.IMG', 'DATA/PACKED.IMG.gz' ):
+            self.assertEqual( results[product]['status'], 'ok' )
+            self.assertIn( 'md5', [ c['check'] for c in results[product]['checks'] ] )
+        self.assertEqual( results['DATA/SUMMED.IMG']['checks'][-1]['check'], 'manifest_md5' )
+        self.assertEqual( len( [ c for c in md5.call_args_list if c.args[0].endswith( 'SUMMED.IMG' ) ] ), 1 )
+
+    def test_long_label_gets_second_read(self):
+        extra = [ f'NOTE_{i} = "{"x"*60}"' for i in range(20) ]
+        self.assertGreater( len( label_text( 30, 21, extra, label_records=20 ) ), 1024 )
+        self.write( 'DATA/LONG.IMG', embedded_img( extra, label_records=20 ) )
+        parsed = verify.read_label( os.path.join( self.root, 'DATA/LONG.IMG' ), limit=1024 )
+        self.assertEqual( parsed['IMAGE/LINES'], '10' )
+
+    def test_main_writes_report(self):
+        self.write( 'DATA/GOOD.IMG', embedded_img() )
+        output = os.path.join( self.root, 'report.json' )
+        self.assertEqual( verify.main( [ self.root, '--output', output, '--workers', '1' ] ), 0 )
+        with open( output ) as f: self.assertEqual( json.load( f )['ok'], 1 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import unittest
+import os
+import gzip
+import time
+import queue
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+import watch
+from sample_products import label_text, embedded_img
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.watcher = watch.Watcher( self.tmp, handler=None, settle=60 )
+
+    def tearDown(self):
+        shutil.rmtree( self.tmp )
+
+    def dispatched(self):
+        items = []
+        while not self.watcher.queue.empty(): items.append( self.watcher.queue.get_nowait() )
+        return items
+
+    def test_embedded_img_waits_for_geometry(self):
+        path = os.path.join( self.tmp, 'A.IMG' )
+        data = embedded_img()
+        with open( path, 'wb' ) as f: f.write( data[:150] )   # label not finished
+        self.watcher.poll()
+        with open( path, 'ab' ) as f: f.write( data[150:700] )
+        self.watcher.poll()
+        self.assertEqual( self.dispatched(), [] )
+
+        with open( path, 'ab' ) as f: f.write( data[700:] )
+        self.watcher.poll()
+        items = self.dispatched()
+        self.assertEqual( [ p for p, _ in items ], [ path ] )
+        self.assertEqual( items[0][1]['IMAGE/LINES'], '10' )
+
+        self.watcher.poll()
+        self.assertEqual( self.dispatched(), [] )                   # not dispatched twice
+
+    def test_detached_label_waits_for_data_file(self):
+        lbl = os.path.join( self.tmp, 'B.LBL' )
+        img = os.path.join( self.tmp, 'B.IMG' )
+        with open( lbl, 'wb' ) as f: f.write( label_text( 10, '"B.IMG"' ) )
+        self.watcher.poll()
+        with open( img, 'wb' ) as f: f.write( bytes( 999 ) )
+        self.watcher.poll()
+        self.assertEqual( self.dispatched(), [] )
+
+        with open( img, 'ab' ) as f: f.write( bytes( 1 ) )
+        self.watcher.poll()
+        self.assertEqual( [ p for p, _ in self.dispatched() ], [ lbl ] )  # the data file carries no label
+        self.assertNotIn( img, self.watcher.pending )
+
+    def test_data_file_in_other_case(self):
+        lbl = os.path.join( self.tmp, 'B.LBL' )
+        img = os.path.join( self.tmp, 'b.img' )
+        with open( lbl, 'wb' ) as f: f.write( label_text( 10, '"B.IMG"' ) )
+        with open( img, 'wb' ) as f: f.write( bytes( 1000 ) )
+        self.watcher.poll()
+        self.assertEqual( [ p for p, _ in self.dispatched() ], [ lbl ] )
+        self.assertIn( img, self.watcher.done )
+
+    def test_table_label_waits_and_warns_once(self):
+        lbl = os.path.join( self.tmp, 'T.LBL' )
+        with open( lbl, 'wb' ) as f:
+            f.write( b'PDS_VERSION_ID = PDS3\r\nRECORD_BYTES = 50\r\nFILE_RECORDS = 2\r\n^TABLE = "T.TAB"\r\nEND\r\n' )
+        old = time.time() - 120
+        os.utime( lbl, ( old, old ) )
+        with mock.patch( 'watch.warn' ) as warn:
+            self.watcher.poll()
+            self.watcher.poll()
+        self.assertEqual( [ c.args[0] for c in warn.call_args_list ], [ f"Data file T.TAB of {lbl} not found, waiting" ] )
+        self.assertEqual( self.dispatched(), [] )
+
+        with open( os.path.join( self.tmp, 'T.TAB' ), 'wb' ) as f: f.write( bytes( 100 ) )
+        self.watcher.poll()
+        self.assertEqual( [ p for p, _ in self.dispatched() ], [ lbl ] )
+
+    def test_compressed_product_needs_quiet_period(self):
+        path = os.path.join( self.tmp, 'C.IMG.gz' )
+        with open( path, 'wb' ) as f: f.write( gzip.compress( embedded_img() ) )
+        self.watcher.poll()
+        self.assertEqual( self.dispatched(), [] )
+
+        old = time.time() - 120
+        os.utime( path, ( old, old ) )
+        self.watcher.poll()
+        self.assertEqual( [ p for p, _ in self.dispatched() ], [ path ] )
+
+    def test_unchanged_directories_are_not_listed(self):
+        sub = os.path.join( self.tmp, 'sub' )
+        os.mkdir( sub )
+        old = time.time() - 60
+        for d in ( sub, self.tmp ): os.utime( d, ( old, old ) )
+        self.watcher.poll()
+
+        with mock.patch( 'watch.os.scandir', wraps=os.scandir ) as scandir:
+            self.watcher.poll()
+            self.assertEqual( scandir.call_count, 0 )
+            with open( os.path.join( sub, 'D.IMG' ), 'wb' ) as f: f.write( embedded_img() )
+            self.watcher.poll()
+            self.assertEqual( [ c.args[0] for c in scandir.call_args_list ], [ sub ] )
+        self.assertEqual( len( self.dispatched() ), 1 )
+
+    def test_label_preamble_is_not_mistaken_for_data(self):
+        preambles = {
+            'SFDU.LBL':    b'CCSD3ZF0000100000001NJPL3IF0PDS200000001 = SFDU_LABEL\r\n',
+            'COMMENT.LBL': b'/* detached label */\r\n',
+            'BLANK.LBL':   b'\r\n',
+        }
+        for name, preamble in preambles.items():
+            with open( os.path.join( self.tmp, name ), 'wb' ) as f: f.write( preamble + label_text( 10, 3 ) )
+        self.watcher.poll()
+        self.assertEqual( sorted( os.path.basename( p ) for p, _ in self.dispatched() ), sorted( preambles ) )
+
+    def test_label_without_odl_warns_when_settled(self):
+        path = os.path.join( self.tmp, 'JUNK.LBL' )
+        with open( path, 'wb' ) as f: f.write( b'not a label\r\n' )
+        self.watcher.poll()
+        old = time.time() - 120
+        os.utime( path, ( old, old ) )
+        with mock.patch( 'watch.warn' ) as warn:
+            self.watcher.poll()
+        warn.assert_called_once()
+        self.assertIn( path, self.watcher.done )
+        self.assertEqual( self.dispatched(), [] )
+
+    def test_done_forgets_drained_files(self):
+        sub = os.path.join( self.tmp, 'sub' )
+        os.mkdir( sub )
+        for name in ( os.path.join( self.tmp, 'K.IMG' ), os.path.join( sub, 'L.IMG' ) ):
+            with open( name, 'wb' ) as f: f.write( embedded_img() )
+        self.watcher.poll()
+        self.assertEqual( len( self.watcher.done ), 2 )
+
+        os.remove( os.path.join( self.tmp, 'K.IMG' ) )
+        shutil.rmtree( sub )
+        self.watcher.poll()
+        self.assertEqual( self.watcher.done, {} )
+
+    def test_rewritten_product_is_dispatched(self):
+        path = os.path.join( self.tmp, 'A.IMG' )
+        old = time.time() - 120
+        open( path, 'wb' ).close()
+        os.utime( path, ( old, old ) )
+        os.utime( self.tmp, ( old, old ) )
+        self.watcher.poll()
+        self.assertIn( path, self.watcher.done )
+
+        with open( path, 'wb' ) as f: f.write( embedded_img() )
+        os.utime( self.tmp, ( old, old ) )                          # writing into a file leaves the directory alone
+        self.watcher.poll()
+        self.assertEqual( [ p for p, _ in self.dispatched() ], [ path ] )
+
+    def test_stalled_product_warns(self):
+        path = os.path.join( self.tmp, 'M.IMG' )
+        with open( path, 'wb' ) as f: f.write( embedded_img()[:150] )
+        with open( os.path.join( self.tmp, 'N.IMG' ), 'wb' ) as f: f.write( bytes( 100 ) )
+        with open( os.path.join( self.tmp, 'N.LBL' ), 'wb' ) as f: f.write( label_text( 10, '"N.IMG"' ) )
+        old = time.time() - 120
+        for name in ( 'M.IMG', 'N.IMG' ): os.utime( os.path.join( self.tmp, name ), ( old, old ) )
+        with mock.patch( 'watch.warn' ) as warn:
+            self.watcher.poll()
+        self.assertEqual( [ c.args[0] for c in warn.call_args_list ], [ f"No complete ODL label in {path}, skipped" ] )
+
+    def test_skip_existing(self):
+        with open( os.path.join( self.tmp, 'E.IMG' ), 'wb' ) as f: f.write( embedded_img() )
+        self.watcher.skip_existing = True
+        self.watcher.stopping.set()
+        self.watcher.run()
+        self.watcher.poll()
+        self.assertEqual( self.dispatched(), [] )
+
+    def test_full_queue_stalls_polling(self):
+        watcher = watch.Watcher( self.tmp, handler=None, queue_size=1 )
+        for name in ( 'F.IMG', 'G.IMG' ):
+            with open( os.path.join( self.tmp, name ), 'wb' ) as f: f.write( embedded_img() )
+        poller = threading.Thread( target=watcher.poll )
+        poller.start()
+        poller.join( 0.5 )
+        self.assertTrue( poller.is_alive() )
+        first = watcher.queue.get( timeout=1 )
+        poller.join( 5 )
+        self.assertFalse( poller.is_alive() )
+        second = watcher.queue.get_nowait()
+        self.assertEqual( sorted( os.path.basename( p ) for p, _ in ( first, second ) ), [ 'F.IMG', 'G.IMG' ] )
+
+    def test_handler_latency(self):
+        received = queue.Queue()
+        with watch.Watcher( self.tmp, handler=lambda path, label: received.put( time.time() ), interval=0.05 ):
+            time.sleep( 0.1 )
+            path = os.path.join( self.tmp, 'H.IMG' )
+            with open( path, 'wb' ) as f: f.write( embedded_img() )
+            landed = time.time()
+            self.assertLess( received.get( timeout=5 ) - landed, 1.0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
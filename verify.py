@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# Integrity check of a volume against its labels
+#   file size       == FILE_RECORDS * RECORD_BYTES   ( fixed length records only )
+#   ^IMAGE + LINES * LINE_SAMPLES * BANDS * SAMPLE_BITS fits in the data file
+#   MD5_CHECKSUM in the label, and an optional md5sum style manifest, match the files
+#   ( an embedded label's checksum covers the data objects after the label, the manifest the whole file )
+# labels are parsed from one bounded read of the file head, geometry needs only os.stat,
+# checksums stream through one large buffer per worker, products are spread over a thread or process pool
+
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import odl
+import compressed
+from pointers import parse_pointer, detached_file, resolve
+
+
+LABEL_BYTES = 64 << 10      # head read for the label, longer labels get one more read
+BUFFER_SIZE = 8 << 20       # checksum read size
+END_LINE    = re.compile( rb'^\s*END\s*$', re.MULTILINE )
+
+
+def read_label( path:str, limit:int = LABEL_BYTES ):
+  with compressed.open_source( path ) as f:
+    head = f.read( limit )
+    label = _parse_head( head )
+    if not END_LINE.search( head ) and len(head) == limit:
+      try:
+        size = int( label['LABEL_RECORDS'] ) * int( label['RECORD_BYTES'] )
+      except ( KeyError, ValueError ):
+        size = 0
+      if size > limit:
+        head += f.read( size - limit )
+        label = _parse_head( head )
+  return label
+
+
+def _parse_head( head:bytes ):
+  lines = []
+  for line in head.splitlines( keepends=True ):
+    try:
+      lines.append( line.decode() )
+    except UnicodeDecodeError:             # start of binary data
+      break
+  return odl.ODL().parse( iter(lines) )
+
+
+def image_extent( label:dict ):
+  # ( data file name or None, first byte, byte count ) of the IMAGE object
+  name, location, in_bytes = parse_pointer( label['^IMAGE'] )
+  record_bytes = int( label['RECORD_BYTES'] )
+  offset = location - 1 if in_bytes else ( location - 1 ) * record_bytes
+  get = lambda k, default=None: int( label[k] ) if k in label else default
+  line_bytes = get( 'IMAGE/LINE_SAMPLES' ) * get( 'IMAGE/SAMPLE_BITS' ) // 8 \
+             + get( 'IMAGE/LINE_PREFIX_BYTES', 0 ) + get( 'IMAGE/LINE_SUFFIX_BYTES', 0 )
+  return name, offset, get( 'IMAGE/BANDS', 1 ) * get( 'IMAGE/LINES' ) * line_bytes
+
+
+def data_size( path:str ):
+  # decompressed size for packaged products
+  if compressed.detect( path ) is None: return os.stat( path ).st_size
+  with compressed.open_source( path ) as f: return f.seek( 0, os.SEEK_END )
+
+
+def md5( path:str, decompress:bool = False, start:int = 0, buffer_size:int = BUFFER_SIZE ):
+  # ( hex digest of the bytes from start on, hex digest of all bytes, byte count ) in one pass,
+  # the count is the decompressed size when decompressing
+  digest, whole, total = hashlib.md5(), hashlib.md5() if start else None, 0
+  buf = bytearray( buffer_size )
+  view = memoryview( buf )
+  with ( compressed.open_source( path ) if decompress else open( path, 'rb', buffering=0 ) ) as f:
+    while True:
+      n = f.readinto( buf )
+      if not n: break
+      if whole: whole.update( view[:n] )
+      if total + n > start: digest.update( view[ max( start - total, 0 ):n ] )   # hashlib drops the GIL for large updates
+      total += n
+  return digest.hexdigest(), ( whole or digest ).hexdigest(), total
+
+
+def products( root:str ):
+  # every .LBL, and every .IMG without a detached label next to it
+  found = []
+  for dirpath, dirnames, filenames in os.walk( root ):
+    dirnames.sort()
+    stems = { compressed.split_ext( f )[0].upper()[:-4] for f in filenames if compressed.split_ext( f )[0].upper().endswith( '.LBL' ) }
+    for f in sorted( filenames ):
+      base = compressed.split_ext( f )[0].upper()
+      if base.endswith( '.LBL' ) or ( base.endswith( '.IMG' ) and base[:-4] not in stems ):
+        found.append( os.path.join( dirpath, f ) )
+  return found
+
+
+def check( name:str, file:str, expected, actual ):
+  return { 'check': name, 'file': file, 'expected': expected, 'actual': actual, 'ok': expected == actual }
+
+
+def verify_product( path:str, root:str = '.', hash_files:bool = False ):
+  rel = lambda p: os.path.relpath( p, root ).replace( os.sep, '/' )
+  result = { 'product': rel(path), 'data': None, 'status': 'ok', 'checks': [], 'hashes': {}, 'bytes_read': 0 }
+  try:
+    label = read_label( path )
+    if not label: raise ValueError( 'No ODL label found' )
+    name = detached_file( label )
+    data = resolve( os.path.dirname( path ), name ) if name else path
+    result['data'] = rel(data)
+
+    packed = compressed.detect( data ) is not None
+    summed = 'MD5_CHECKSUM' in label
+    image = image_extent( label ) if '^IMAGE' in label else None
+    start = 0
+    if summed and data == path:                  # embedded label: the checksum covers the data objects, not the label
+      if image and image[0] is None: start = image[1]
+      else: start = int( label.get( 'LABEL_RECORDS', 0 ) ) * int( label.get( 'RECORD_BYTES', 0 ) )
+
+    # each file is read once: the stored bytes serve label and manifest alike unless compressed,
+    # and the checksum pass over a compressed stream yields its decompressed size
+    stored = decoded = size = None
+    if summed and packed:
+      decoded, _, size = md5( data, decompress=True, start=start )
+      result['bytes_read'] += size
+    if hash_files or ( summed and not packed ):
+      tail, stored, count = md5( data, start=0 if packed else start )
+      result['bytes_read'] += count
+      if not packed: decoded, size = tail, count
+    if size is None: size = data_size( data )
+
+    # a detached label without a file pointer describes nothing we can find
+    located = name or not compressed.split_ext( path )[0].upper().endswith( '.LBL' )
+    if located and 'FILE_RECORDS' in label and label.get( 'RECORD_TYPE', 'FIXED_LENGTH' ) == 'FIXED_LENGTH':
+      expected = int( label['FILE_RECORDS'] ) * int( label['RECORD_BYTES'] )
+      result['checks'].append( check( 'file_size', rel(data), expected, size ) )
+    if image and image[0] == name:               # not when the image sits in another file than the data
+      _, offset, count = image
+      c = check( 'image_extent', rel(data), offset + count, min( offset + count, size ) )
+      c['file_size'] = size
+      result['checks'].append( c )
+
+    if summed:
+      result['checks'].append( check( 'md5', rel(data), label['MD5_CHECKSUM'].strip( '"' ).lower(), decoded ) )
+    if hash_files:                               # stored bytes, for the manifest
+      result['hashes'][rel(data)] = stored
+      if path != data:
+        _, result['hashes'][rel(path)], count = md5( path )
+        result['bytes_read'] += count
+  except Exception as e:
+    result['status'] = 'error'
+    result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+  if not all( c['ok'] for c in result['checks'] ): result['status'] = 'failed'
+  return result
+
+
+def read_manifest( path:str ):
+  # md5sum format: '<hex>  <path>' or '<hex> *<path>', paths relative to the volume root
+  # lower case path -> ( path as written, digest ), volumes get mirrored in either case
+  manifest = {}
+  with open( path, 'r' ) as infile:
+    for line in infile:
+      words = line.strip().split( None, 1 )
+      if len(words) == 2:
+        name = words[1].lstrip( '*' ).replace( '\\', '/' )
+        manifest[ name.lower() ] = ( name, words[0].lower() )
+  return manifest
+
+
+def verify_file( name:str, root:str = '.' ):
+  # manifest entry no product covers ( indexes, documents, catalogs ), None when absent
+  for candidate in ( name, name.lower() ):
+    path = os.path.join( root, candidate )
+    if os.path.isfile( path ):
+      _, digest, count = md5( path )
+      return { 'file': candidate, 'status': 'ok', 'checks': [], 'hashes': { candidate: digest }, 'bytes_read': count }
+  return None
+
+
+def verify_volume( root:str, manifest:dict = None, workers:int = 8, processes:bool = False ):
+  start = time.time()
+  paths = products( root )
+  task = functools.partial( verify_product, root=root, hash_files=manifest is not None )
+  pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+  with pool( workers ) as executor:
+    results = list( executor.map( task, paths, chunksize=16 ) )   # chunksize only matters to processes
+    hashed = { f.lower() for r in results for f in r['hashes'] }
+    extra = sorted( name for key, ( name, _ ) in ( manifest or {} ).items() if key not in hashed )
+    found = list( executor.map( functools.partial( verify_file, root=root ), extra, chunksize=16 ) )
+
+  missing = [ name for name, f in zip( extra, found ) if f is None ]
+  files = [ f for f in found if f is not None ]
+  for result in results + files:
+    for file, actual in result.pop( 'hashes' ).items():
+      if manifest is not None and file.lower() in manifest:
+        expected = manifest[file.lower()][1]
+        result['checks'].append( check( 'manifest_md5', file, expected, actual ) )
+        if actual != expected and result['status'] == 'ok': result['status'] = 'failed'
+
+  seconds = time.time() - start
+  bytes_read = sum( r['bytes_read'] for r in results + files )
+  count = lambda status: sum( 1 for r in results if r['status'] == status )
+  return {
+    'root':             root,
+    'products':         len(results),
+    'ok':               count( 'ok' ),
+    'failed':           count( 'failed' ),
+    'errors':           count( 'error' ),
+    'files':            len(files),
+    'files_failed':     sum( 1 for f in files if f['status'] != 'ok' ),
+    'missing':          missing,
+    'bytes_read':       bytes_read,
+    'seconds':          round( seconds, 3 ),
+    'bytes_per_second': round( bytes_read / seconds ) if seconds else None,
+    'results':          results,
+    'file_results':     files,
+  }
+
+
+def main( argv=None ):
+  parser = argparse.ArgumentParser( description='Verify PDS3 products against their label geometry and checksums' )
+  parser.add_argument( 'root', help='volume directory' )
+  parser.add_argument( '--manifest', help='md5sum style checksum file, paths relative to root' )
+  parser.add_argument( '--workers', type=int, default=8 )
+  parser.add_argument( '--processes', action='store_true', help='use a process pool instead of threads' )
+  parser.add_argument( '--output', help='write the JSON report here instead of stdout' )
+  args = parser.parse_args( argv )
+
+  manifest = read_manifest( args.manifest ) if args.manifest else None
+  report = verify_volume( args.root, manifest, args.workers, args.processes )
+  if args.output:
+    with open( args.output, 'w' ) as outfile: json.dump( report, outfile, indent=2 )
+  else:
+    json.dump( report, sys.stdout, indent=2 )
+  return 0 if report['ok'] == report['products'] and not report['files_failed'] and not report['missing'] else 1
+
+
+if __name__ == '__main__':
+  sys.exit( main() )
@@ -0,0 +1,240 @@
+# Watch staging directories for arriving products
+#   directories are re-listed only when their mtime moves, unchanged trees cost one stat each,
+#   dispatched products get one stat per poll too, since appends and rewrites don't move the directory mtime
+#   a product is complete once its label reached END and the file reached FILE_RECORDS * RECORD_BYTES,
+#   or, when that can't be known ( compressed files, labels without geometry ), once it sat unmodified for settle seconds
+#   complete products are parsed once and handed to handler( path, label ) on a bounded worker queue
+
+
+import os
+import time
+import queue
+import threading
+
+import odl
+import pointers
+import compressed
+from odl import warn
+
+
+SUFFIXES     = ( '.LBL', '.IMG' )
+HEADERS      = ( 'PDS_VERSION_ID', 'ODL_VERSION_ID' )
+PREAMBLE     = ( '/*', 'CCSD' )  # comments and SFDU wrappers may precede the version line
+RACY_WINDOW  = 2.0     # seconds, directories modified this recently are re-listed on every poll
+
+
+def is_product( path:str ):
+  base, _ = compressed.split_ext( path )
+  return base.upper().endswith( SUFFIXES )
+
+
+def read_label( path:str ):
+  # parsed label, or None while the label text has not reached its END statement
+  last = [ None ]
+  def lines( infile ):
+    header = False
+    try:
+      for line in infile:
+        text = line.strip()
+        if not header and text and not text.startswith( PREAMBLE ):
+          if not text.startswith( HEADERS ): return   # data file, no label
+          header = True
+        last[0] = line
+        yield line
+    except ( EOFError, UnicodeDecodeError ):   # truncated stream, or binary data without a label
+      return
+  try:
+    with compressed.open_label( path ) as infile:
+      label = odl.ODL().parse( lines( infile ) )
+  except OSError:
+    return None
+  if last[0] is None or last[0].strip() != 'END': return None
+  return label
+
+
+def expected_size( label:dict ):
+  try:
+    return int( label['FILE_RECORDS'] ) * int( label['RECORD_BYTES'] )
+  except ( KeyError, ValueError ):
+    return None
+
+
+def data_file( lbl_path:str, label:dict ):
+  # detached data file named by any ^<OBJECT> pointer, as found on disk, None for attached data
+  name = pointers.detached_file( label )
+  return name and pointers.resolve( os.path.dirname( lbl_path ), name )
+
+
+def has_label( path:str ):
+  # a data file with a detached label beside it carries no label of its own
+  directory, stem = os.path.split( os.path.splitext( compressed.split_ext( path )[0] )[0] )
+  return os.path.exists( pointers.resolve( directory, stem + '.LBL' ) )
+
+
+class Watcher(object):
+
+  def __init__( self, dirs, handler, workers:int = 4, queue_size:int = 64,
+                interval:float = 0.25, settle:float = 2.0, skip_existing:bool = False ):
+    self.roots    = [ dirs ] if isinstance( dirs, str ) else list( dirs )
+    self.handler  = handler
+    self.interval = interval
+    self.settle   = settle
+    self.skip_existing = skip_existing
+
+    self.queue    = queue.Queue( queue_size )     # full queue stalls polling: backpressure
+    self.dirs     = {}                            # directory -> mtime_ns when last listed
+    self.pending  = {}                            # product -> ( size, mtime_ns ) when last checked
+    self.labels   = {}                            # product -> label parsed at that ( size, mtime_ns )
+    self.done     = {}                            # product -> ( size, mtime_ns ) when dispatched
+    self.orphans  = set()                         # settled labels already warned about a missing data file
+    self.stopping = threading.Event()
+    self.threads  = [ threading.Thread( target=self._work, daemon=True ) for _ in range(workers) ]
+    self.poller   = threading.Thread( target=self.run, daemon=True )
+
+  def __enter__( self ): return self.start()
+  def __exit__( self, *exc ): self.stop()
+
+  def start( self ):
+    for t in self.threads: t.start()
+    self.poller.start()
+    return self
+
+  def stop( self ):
+    # products already queued are still handled
+    self.stopping.set()
+    if self.poller.is_alive(): self.poller.join()
+    for _ in self.threads: self.queue.put( None )
+    for t in self.threads:
+      if t.is_alive(): t.join()
+
+  def run( self ):
+    if self.skip_existing:
+      self.scan()
+      for path in list( self.pending ):
+        try:
+          st = os.stat( path )
+          self.done[path] = ( st.st_size, st.st_mtime_ns )
+        except FileNotFoundError:
+          pass
+      self.pending.clear()
+    while not self.stopping.is_set():
+      self.poll()
+      self.stopping.wait( self.interval )
+
+  def poll( self ):
+    self.scan()
+    for path, state in list( self.done.items() ):  # appends and rewrites leave the directory mtime alone
+      try:
+        st = os.stat( path )
+      except FileNotFoundError:
+        del self.done[path]                         # drained from staging
+        continue
+      if ( st.st_size, st.st_mtime_ns ) != state:
+        del self.done[path]
+        self.pending[path] = None
+    now = time.time()
+    for path in list( self.pending ):
+      if path not in self.pending: continue         # data file settled by its label meanwhile
+      try:
+        st = os.stat( path )
+      except FileNotFoundError:
+        self._forget( path )
+        continue
+      state = ( st.st_size, st.st_mtime_ns )
+      if self.pending[path] != state:
+        self.pending[path] = state
+        self.labels.pop( path, None )
+      ready, label = self._check( path, st, now )
+      if ready:
+        self._forget( path )
+        self.done[path] = state
+        target = label and data_file( path, label )
+        if target and os.path.exists( target ):     # the detached data file is accounted for too
+          self._forget( target )
+          st = os.stat( target )
+          self.done[target] = ( st.st_size, st.st_mtime_ns )
+        if label is not None and not self._put( ( path, label ) ): return
+
+  def scan( self ):
+    # list new or recently modified directories, queue products not yet dispatched
+    now = time.time()
+    todo = list( self.roots ) + [ d for d in self.dirs if d not in self.roots ]
+    while todo:
+      d = todo.pop()
+      try:
+        mtime = os.stat( d ).st_mtime_ns
+      except FileNotFoundError:
+        self._drop_dir( d )
+        continue
+      if self.dirs.get( d ) == mtime and now - mtime/1e9 > RACY_WINDOW: continue
+      self.dirs[d] = mtime
+      try:
+        entries = list( os.scandir( d ) )
+      except FileNotFoundError:
+        self._drop_dir( d )
+        continue
+      for entry in entries:
+        if entry.is_dir():
+          if entry.path not in self.dirs: todo.append( entry.path )
+        elif is_product( entry.path ) and entry.path not in self.pending:
+          st = entry.stat()
+          if self.done.get( entry.path ) != ( st.st_size, st.st_mtime_ns ):
+            self.pending[entry.path] = None
+
+  def _check( self, path:str, st, now:float ):
+    # ( complete, label to dispatch ), detached data files are complete without a label of their own
+    quiet = now - st.st_mtime >= self.settle
+    if path not in self.labels: self.labels[path] = read_label( path ) if st.st_size else None
+    label = self.labels[path]
+    base, _ = compressed.split_ext( path )
+    is_lbl = base.upper().endswith( '.LBL' )
+    if label is None:
+      if quiet and st.st_size and ( is_lbl or not has_label( path ) ):   # stalled or not a product
+        warn( f"No complete ODL label in {path}, skipped" )
+      return quiet, None
+
+    target = path
+    if is_lbl:
+      target = data_file( path, label )
+      if target is None: return True, label
+      try:
+        st = os.stat( target )
+      except FileNotFoundError:
+        if quiet and path not in self.orphans:
+          self.orphans.add( path )
+          warn( f"Data file {os.path.basename( target )} of {path} not found, waiting" )
+        return False, None
+      quiet = now - st.st_mtime >= self.settle
+
+    size = expected_size( label )
+    if size is not None and compressed.detect( target ) is None:
+      return st.st_size >= size, label
+    return quiet, label
+
+  def _drop_dir( self, d:str ):
+    self.dirs.pop( d, None )
+    prefix = d + os.sep
+    for path in [ p for p in self.done if p.startswith( prefix ) ]: del self.done[path]
+
+  def _forget( self, path:str ):
+    self.pending.pop( path, None )
+    self.labels.pop( path, None )
+    self.orphans.discard( path )
+
+  def _put( self, item ):
+    while not self.stopping.is_set():
+      try:
+        self.queue.put( item, timeout=self.interval )
+        return True
+      except queue.Full:
+        continue
+    return False
+
+  def _work( self ):
+    while True:
+      item = self.queue.get()
+      if item is None: return
+      try:
+        self.handler( *item )
+      except Exception as e:
+        warn( f"Handler failed for {item[0]}: {e}" )